@@ -1,27 +1,19 @@
 #!/usr/bin/env python3
 # Usage: python generate.py <count> <difficulty: easy | difficult> <out_path>
 
-import sys, subprocess, pathlib, json, shutil, tempfile, random
+import os, subprocess, pathlib, json, random, itertools, functools, collections, concurrent.futures, argparse
 
-def die(msg: str, code: int = 2):
-    print(msg, file=sys.stderr)
-    sys.exit(code)
+parser = argparse.ArgumentParser(description="Generate tilted-scales puzzles with batched LLM explanations.")
+parser.add_argument("count", type=int, help="number of puzzles (1..200)")
+parser.add_argument("difficulty", type=str.lower, choices=["easy", "difficult"])
+parser.add_argument("out_path", type=pathlib.Path)
+args = parser.parse_args()
 
-if len(sys.argv) != 4:
-    die("Usage: python generate.py <count> <difficulty: easy|difficult> <out_path>")
+if not 1 <= args.count <= 200:
+    parser.error("count must be an integer between 1 and 200")
 
-count_raw, difficulty, out_path = sys.argv[1], sys.argv[2].lower(), sys.argv[3]
-try:
-    count = int(count_raw)
-    assert 1 <= count <= 200
-except Exception:
-    die("count must be an integer between 1 and 200")
-
-if difficulty not in {"easy", "difficult"}:
-    die("difficulty must be one of: easy | difficult")
-
-path = pathlib.Path(out_path)
-path.parent.mkdir(parents=True, exist_ok=True)
+count, difficulty, path = args.count, args.difficulty, args.out_path
+os.makedirs(path.parent, exist_ok=True)
 
 
 #-------------GLOBALS----------------
@@ -30,189 +22,254 @@ SHAPES = ["s", "t", "c"]
 SHAPE_WORD = {"s": "square", "t": "triangle", "c": "circle"}
 
 
-def _pick_distinct(vars_list, n):
-    return random.sample(vars_list, n)
+#one generator instance for every draw (bound methods, single place to seed)
+_rng = random.Random()
 
 
-#-------------EASY PUZZLES HELPER FUNCTIONS-------
+#answer order as indexes into (X, Y), keyed on (X is heavier, op == '<')
+_ORDER = {(True, True): (1, 0), (True, False): (0, 1), (False, True): (0, 1), (False, False): (1, 0)}
 
-#GENERATE EASY EQUATION IN THE FORM k1X + k3Z = k2Y + k3Z 
-def easy_puzzle_proportional_equality():
-    shapes = _pick_distinct(SHAPES,3)
-    X = shapes[0]
-    Y = shapes[1]
-    Z = shapes[2]
-    k1 = random.randint(1, 6)
-    choices = [v for v in range(1, 7) if v != k1]
-    k2 = random.choice(choices)
-    k3 = 0
-    
-   
-    equality = {
-    "left":  { "shapes": {X:k1, Y:0, Z:k3}, "weight": 0 },
-    "right": { "shapes": {X:0, Y:k2, Z:k3}, "weight": 0 },
-    }
-    
-  
-    #Add third shape to both sides 50/50 chance
-    if(random.random() > 0.5):
-        k3 = random.randint(1, 4)
-        equality["left"]["shapes"][Z] = k3
-        equality["right"]["shapes"][Z] = k3
-    
-    #GEN Inequality
-    op = '>'
-    if(random.random()>0.5):
-        op = '<'
-    
-    inequality_template = '_'+op+'_'
+#all 6 orderings of (X, Y, Z)
+PERMS = list(itertools.permutations(SHAPES, 3))
 
-    answer = []
-    if k1 < k2: #X > Y
-        if op=='<':
-            answer = [Y,X]
-        else:
-            answer = [X,Y]
-    else: #Y > X
-        if op=='<':
-            answer = [X,Y]
-        else:
-            answer = [Y,X]
+
+#count independent draws from [lo, hi] in a single call
+def _draw(lo, hi, count):
+    return _rng.choices(range(lo, hi + 1), k=count)
+
+
+#count 50/50 coin flips from a single getrandbits call (one bit per flip)
+def _coins(count):
+    if count == 0:
+        return []
+    return [bit == "1" for bit in f"{_rng.getrandbits(count):0{count}b}"]
+
+
+#count random operators, '<' or '>'
+def _ops(count):
+    return ['<' if c else '>' for c in _coins(count)]
 
 
+#-------------PUZZLE REPRESENTATION-------
+
+#Flat puzzle row, nested dicts are only built once by to_dict.
+#equality: kL1/kL2/kL3 and kR1/kR2/kR3 are the X/Y/Z counts per side, wL/wR the weights
+#inequality: answer[0] vs answer[1] (plus Z on both sides if iZ) with weights iwL/iwR,
+#op is None for difficult puzzles (no "op" key)
+#kind names the builder ("proportional", "weighted", "difficult"); not serialized
+Puzzle = collections.namedtuple(
+    "Puzzle", "kind X Y Z kL1 kL2 kL3 wL kR1 kR2 kR3 wR op iwL iwR iZ ineq_tmpl answer")
+
+
+def to_dict(p):
+    X, Y, Z = p.X, p.Y, p.Z
+
+    equality = {
+    "left":  { "shapes": {X:p.kL1, Y:p.kL2, Z:p.kL3}, "weight": p.wL },
+    "right": { "shapes": {X:p.kR1, Y:p.kR2, Z:p.kR3}, "weight": p.wR },
+    }
+
+    #every pan keeps all three shapes (the UI indexes them); built in one go, no zero-then-set pass
+    L, R, iZ = p.answer[0], p.answer[1], p.iZ
     inequality = {
-    "left":  { "shapes": {X:0, Y:0, Z:0}, "weight": 0 },
-    "right": { "shapes": {X:0, Y:0, Z:0}, "weight": 0 },
-    "op": op
+    "left":  { "shapes": {s: int(s == L or (iZ and s == Z)) for s in (X, Y, Z)}, "weight": p.iwL },
+    "right": { "shapes": {s: int(s == R or (iZ and s == Z)) for s in (X, Y, Z)}, "weight": p.iwR },
+    }
+    if p.op is not None:
+        inequality["op"] = p.op
+
+    return {
+        "equality": equality,
+        "inequality": inequality,
+        "ineq_template": p.ineq_tmpl,
+        "answer": list(p.answer)
     }
 
-    inequality["left"]["shapes"][answer[0]] = 1
-    inequality["right"]["shapes"][answer[1]] = 1
 
+#LLM payload copy of an inequality with zero shape counts dropped (output keeps full pans)
+def compact_inequality(inequality):
+    compact = {side: {"shapes": {s: k for s, k in inequality[side]["shapes"].items() if k},
+                      "weight": inequality[side]["weight"]}
+               for side in ("left", "right")}
+    if "op" in inequality:
+        compact["op"] = inequality["op"]
+    return compact
+
+
+#-------------EASY PUZZLES HELPER FUNCTIONS-------
+
+#GENERATE EASY EQUATION IN THE FORM k1X + k3Z = k2Y + k3Z 
+def _build_easy_proportional(shapes, k1, k2, k3, op):
+    X, Y, Z = shapes
     
+    #GEN Inequality
+    inequality_template = '_'+op+'_'
 
-    return [equality, inequality_template, inequality, answer]
+    #k1 < k2 -> X > Y
+    xy = (X, Y)
+    i0, i1 = _ORDER[(k1 < k2, op == '<')]
+    answer = (xy[i0], xy[i1])
 
+    return Puzzle("proportional", X, Y, Z, k1, 0, k3, 0, 0, k2, k3, 0,
+                  op, 0, 0, False, inequality_template, answer)
 
-#Easy puzzle in the form k1X + w1 = k1Y + w2
-def easy_puzzle_weighted_equality():
-    shapes = _pick_distinct(SHAPES,3)
-    X = shapes[0]
-    Y = shapes[1]
-    Z = shapes[2]
-    w1 = random.randint(1, 6)
-    choices = [v for v in range(1, 7) if v != w1]
-    w2 = random.choice(choices)
-    k1 = random.randint(1, 4)
 
-    equality = {
-    "left":  { "shapes": {X:k1, Y:0, Z:0}, "weight": w1 },
-    "right": { "shapes": {X:0, Y:k1, Z:0}, "weight": w2 },
-    }
+def easy_puzzle_proportional_equality_batch(count):
+    k1s = _draw(1, 6, count)
+    #offset by 1..5 (mod 6) so k2 != k1
+    k2s = [(k1 - 1 + off) % 6 + 1 for k1, off in zip(k1s, _draw(1, 5, count))]
+    k3s = [k3 if add else 0 for k3, add in zip(_draw(1, 4, count), _coins(count))]
+    ops = _ops(count)
+    perms = _rng.choices(PERMS, k=count)
+    return [_build_easy_proportional(shapes, k1, k2, k3, op)
+            for shapes, k1, k2, k3, op in zip(perms, k1s, k2s, k3s, ops)]
 
 
+#Easy puzzle in the form k1X + w1 = k1Y + w2
+def _build_easy_weighted(shapes, k1, w1, w2, op):
+    X, Y, Z = shapes
+
     #INEQ
-    op = '>'
-    if(random.random()>0.5):
-        op = '<'
-    
     inequality_template = '_'+op+'_'
 
-    answer = []
-    if w1 < w2:
-        answer = [X,Y] if op=='>' else [Y,X]
-    else:
-        answer = [Y,X] if op=='>' else [X,Y]
+    #w1 < w2 -> X > Y
+    xy = (X, Y)
+    i0, i1 = _ORDER[(w1 < w2, op == '<')]
+    answer = (xy[i0], xy[i1])
 
-   
-    inequality = {
-    "left":  { "shapes": {X:0, Y:0, Z:0}, "weight": 0 },
-    "right": { "shapes": {X:0, Y:0, Z:0}, "weight": 0 },
-    "op": op
-    }
+    return Puzzle("weighted", X, Y, Z, k1, 0, 0, w1, 0, k1, 0, w2,
+                  op, 0, 0, False, inequality_template, answer)
 
-    inequality["left"]["shapes"][answer[0]] = 1
-    inequality["right"]["shapes"][answer[1]] = 1
 
-    return [equality, inequality_template, inequality, answer]
+def easy_puzzle_weighted_equality_batch(count):
+    w1s = _draw(1, 6, count)
+    w2s = [(w1 - 1 + off) % 6 + 1 for w1, off in zip(w1s, _draw(1, 5, count))]
+    k1s = _draw(1, 4, count)
+    ops = _ops(count)
+    perms = _rng.choices(PERMS, k=count)
+    return [_build_easy_weighted(shapes, k1, w1, w2, op)
+            for shapes, k1, w1, w2, op in zip(perms, k1s, w1s, w2s, ops)]
     
 
 #-------------Medium / Difficult PUZZLES HELPER FUNCTIONS-------
 
 #Equality form k1X+w1=k1Y+w2 and Inequality form X + Z + w3 > Y + Z + w4
-def difficult_puzzle_weighted_equality():
-    shapes = _pick_distinct(SHAPES,3)
-    X = shapes[0]
-    Y = shapes[1]
-    Z = shapes[2]
-    k1 = random.randint(1, 3)
-    
-
-    w = random.randint(1,4)
-    w_offset = random.randint(2,4)
+def _build_difficult_weighted(shapes, k1, w, w_offset, swap, weight_offset):
+    X, Y, Z = shapes
 
     weights = [k1*w, k1*(w+w_offset)]
-    weights = _pick_distinct(weights,2)
-    
-   
-    equality = {
-    "left":  { "shapes": {X:k1, Y:0, Z:0}, "weight": weights[0] },
-    "right": { "shapes": {X:0, Y:k1, Z:0}, "weight": weights[1] },
-    }
-
-    d = (weights[1] - weights[0]) / k1
+    if swap:
+        weights.reverse()
 
-    inequality_weight = int(abs(d) - 1)
+    #per-unit gap d = (weights[1] - weights[0]) / k1 is exactly +w_offset, or
+    #-w_offset when swapped -> pure integer math, no float divide / abs / int cast
+    inequality_weight = w_offset - 1
 
 
     inequality_template = "_>_+"+str(inequality_weight)
 
 
-    inequality = {
-    "left":  { "shapes": {X:0, Y:0, Z:0}, "weight": 0 },
-    "right": { "shapes": {X:0, Y:0, Z:0}, "weight": inequality_weight },
-    }
+    if swap:
+        answer=(Y,X)
+    else:
+        answer=(X,Y)
+
+    #increase difficulty level (weight_offset == 0 keeps the plain form)
+    if weight_offset:
+       inequality_template = "_+"+Z+"+"+str(weight_offset)+">_+"+Z+"+"+str(inequality_weight+weight_offset)
+
+    return Puzzle("difficult", X, Y, Z, k1, 0, 0, weights[0], 0, k1, 0, weights[1],
+                  None, weight_offset, inequality_weight + weight_offset, bool(weight_offset),
+                  inequality_template, answer)
+
+
+def difficult_puzzle_weighted_equality_batch(count):
+    k1s = _draw(1, 3, count)
+    ws = _draw(1, 4, count)
+    w_offsets = _draw(2, 4, count)
+    swaps = _coins(count)
+    weight_offsets = [off if hard else 0 for off, hard in zip(_draw(1, 5, count), _coins(count))]
+    perms = _rng.choices(PERMS, k=count)
+    return [_build_difficult_weighted(shapes, k1, w, w_offset, swap, weight_offset)
+            for shapes, k1, w, w_offset, swap, weight_offset in zip(perms, k1s, ws, w_offsets, swaps, weight_offsets)]
+
+
+
+
+#-------------LOCAL EXPLANATIONS-------
+#Deterministic versions of the prompt rules, used instead of the LLM when
+#TS_LOCAL_EXPLAIN=1 (no subprocess / network round-trip)
 
+LOCAL_EXPLAIN = os.environ.get("TS_LOCAL_EXPLAIN") == "1"
 
 
-    answer = []
-    if d>0:
-        answer=[X,Y]
+def _shape_count(shape, k):
+    return f"{k} {SHAPE_WORD[shape]}" + ("s" if k != 1 else "")
+
+
+def _filled(p):
+    return p.ineq_tmpl.replace("_", p.answer[0], 1).replace("_", p.answer[1], 1)
+
+
+#k1*X (+ k3*Z) = k2*Y (+ k3*Z): fewer shapes needed -> heavier shape
+def local_explain_easy_proportional(p):
+    heavy = p.X if p.kL1 < p.kR2 else p.Y
+    cancel = f"Cancel the {SHAPE_WORD[p.Z]}s; " if p.kL3 else ""
+    filled = _filled(p)
+    verb = "balances" if p.kL1 == 1 else "balance"
+    explanation = (f"{cancel}{_shape_count(p.X, p.kL1)} {verb} {_shape_count(p.Y, p.kR2)}, "
+                   f"so fewer {SHAPE_WORD[heavy]}s are needed and {SHAPE_WORD[heavy]} is heavier. So {filled}.")
+    return explanation, filled
+
+
+#k*X + w1 = k*Y + w2: side with the heavier add-on has the lighter shape
+def local_explain_easy_weighted(p):
+    heavy = p.X if p.wL < p.wR else p.Y
+    filled = _filled(p)
+    explanation = (f"The {SHAPE_WORD[p.X]} side adds {p.wL} and the {SHAPE_WORD[p.Y]} side adds {p.wR}, "
+                   f"so {SHAPE_WORD[heavy]} is heavier. So {filled}.")
+    return explanation, filled
+
+
+#k*X + w1 = k*Y + w2 reduces to heavy = light + gap, compare gap with the add-ons
+def local_explain_difficult(p):
+    heavy, light = p.answer
+    gap = p.iwR - p.iwL + 1
+    filled = _filled(p)
+    if p.iZ:
+        explanation = (f"Since {heavy}={light}+{gap}, cancel {p.Z}; left adds {p.iwL} and right adds {p.iwR}, "
+                       f"{SHAPE_WORD[heavy]} stays heavier. So {filled}.")
     else:
-        answer=[Y,X]
-    
+        explanation = (f"Since {heavy}={light}+{gap}, adding {p.iwR} on the right still leaves "
+                       f"{SHAPE_WORD[heavy]} heavier. So {filled}.")
+    return explanation, filled
 
-    inequality["left"]["shapes"][answer[0]] = 1
-    inequality["right"]["shapes"][answer[1]] = 1
 
-    #increase difficulty level
-    if(random.random()>0.5):
-       inequality["left"]["shapes"][Z] = 1
-       inequality["right"]["shapes"][Z] = 1
-       weight_offset = random.randint(1, 5)
-       inequality["left"]["weight"] += weight_offset
-       inequality["right"]["weight"] += weight_offset
-       inequality_template = "_+"+Z+"+"+str(weight_offset)+">_+"+Z+"+"+str(inequality_weight+weight_offset)
-       
+_LOCAL_EXPLAINERS = {
+    "proportional": local_explain_easy_proportional,
+    "weighted": local_explain_easy_weighted,
+    "difficult": local_explain_difficult,
+}
 
 
-    return [equality, inequality_template, inequality, answer]
+def local_explain(p):
+    return _LOCAL_EXPLAINERS[p.kind](p)
 
 
 
 
 #---------------------GENERATE PUZZLE ITEMS--------------
 
-puzzles = []
+#draw every random field for the whole batch up front (one call per field)
+#and hand the rows to the _batch helpers
 if difficulty == "easy":
-    for i in range(1, count + 1):
-        if(random.random() > 0.5):
-            puzzles.append(easy_puzzle_proportional_equality())
-        else:
-            puzzles.append(easy_puzzle_weighted_equality())
+    proportional = _coins(count)
+    n_prop = sum(proportional)
+    prop_puzzles = iter(easy_puzzle_proportional_equality_batch(n_prop))
+    weighted_puzzles = iter(easy_puzzle_weighted_equality_batch(count - n_prop))
+    puzzles = [next(prop_puzzles) if p else next(weighted_puzzles) for p in proportional]
 else:
-    for i in range(1, count + 1):
-        puzzles.append(difficult_puzzle_weighted_equality())
+    puzzles = difficult_puzzle_weighted_equality_batch(count)
 
 
 
@@ -220,11 +277,13 @@ else:
 
 # -------------------- PROMPTS (BATCH) --------------------
 
-BATCH_PROMPT_EASY = lambda n: f"""
+#templates are plain text with {n} placeholders (no f-string escaping) and are split
+#at {n} into pre-encoded parts once; a prompt is then a single bytes join
+_EASY_TEMPLATE = """
 You will receive JSON with an array "items" of length {n}. Each element has:
 - "index": integer (keep it unchanged in your output),
 - "equality": balanced scale (left/right shapes + weight),
-- "inequality": final comparison content + "op" (>,<),
+- "inequality": final comparison content + "op" (>,<); "shapes" lists only shapes present (missing = 0),
 - "ineq_template": string with two "_" blanks (e.g., "_>_","_<_"),
 - "answer": array — IGNORE it completely (grader use only).
 
@@ -233,7 +292,7 @@ Shapes: s=square, t=triangle, c=circle.
 YOUR JOB
 For each item, DERIVE which symbols go into the two blanks (left → right) and return ONLY a JSON array of length {n}:
 [
-  {{"index": <same index>, "explanation": "<MAX 2 very short sentences; end with the exact filled inequality, no spaces>", "reasoned_answer": "<filled inequality, no spaces>"}},
+  {"index": <same index>, "explanation": "<MAX 2 very short sentences; end with the exact filled inequality, no spaces>", "reasoned_answer": "<filled inequality, no spaces>"},
   ...
 ]
 
@@ -246,11 +305,11 @@ HARD RULES (no preamble, no steps)
 - Output ONLY the JSON array; no extra text, no code fences.
 """.strip()
 
-BATCH_PROMPT_DIFFICULT = lambda n: f"""
+_DIFFICULT_TEMPLATE = """
 You will receive JSON with an array "items" of length {n}. Each element has:
 - "index": integer (keep it unchanged in your output),
 - "equality": balanced scale (left/right shapes + weight),
-- "inequality": final comparison content + "op" (>,<),
+- "inequality": final comparison content + "op" (>,<); "shapes" lists only shapes present (missing = 0),
 - "ineq_template": string with two "_" blanks (may include "+<shape>" and/or "+<number>"),
 - "answer": array — IGNORE it completely (grader use only).
 
@@ -258,7 +317,7 @@ Shapes: s=square, t=triangle, c=circle.
 
 OUTPUT (JSON ONLY)
 Return a JSON array of length {n}. Each element:
-{{"index": <same index>, "explanation": "<MAX 2 very short sentences; end with the exact filled inequality, no spaces>", "reasoned_answer": "<filled inequality, no spaces>"}}
+{"index": <same index>, "explanation": "<MAX 2 very short sentences; end with the exact filled inequality, no spaces>", "reasoned_answer": "<filled inequality, no spaces>"}
 
 HARD RULES
 - Use only simple words about shapes and weights (e.g., "cancel c", "remove 1 weight", "square 3 heavier"). No algebra steps.
@@ -271,82 +330,122 @@ PRACTICAL EXAMPLES (style to imitate; do not copy numbers)
 Example 1:
 Input equality: 2s+8 = 2t+14 | template: _+c+3>_+c+5
 Desired element:
-{{"index": 0, "explanation": "Since s=t+3, cancel c; left adds 3 and right adds 5, square stays heavier. So s+c+3>t+c+5.", "reasoned_answer": "s+c+3>t+c+5"}}
+{"index": 0, "explanation": "Since s=t+3, cancel c; left adds 3 and right adds 5, square stays heavier. So s+c+3>t+c+5.", "reasoned_answer": "s+c+3>t+c+5"}
 
 Example 2:
 Reduced equality: s=c+2 | template intent: _>_+1
 Desired element:
-{{"index": 1, "explanation": "Since s=c+2, removing 1 on the right still leaves square heavier. So s>c+1.", "reasoned_answer": "s>c+1"}}
+{"index": 1, "explanation": "Since s=c+2, removing 1 on the right still leaves square heavier. So s>c+1.", "reasoned_answer": "s>c+1"}
 """.strip()
 
 
 
-# -------------------- BATCH CALL --------------------
+_EASY_PARTS = tuple(part.encode("utf-8") for part in _EASY_TEMPLATE.split("{n}"))
+_DIFFICULT_PARTS = tuple(part.encode("utf-8") for part in _DIFFICULT_TEMPLATE.split("{n}"))
 
 
-batch_items = []
-for i, (equality_dict, inequality_template, inequality_dict, answer) in enumerate(puzzles, start=1):
-    batch_items.append({
-        "index": i,
-        "equality": equality_dict,
-        "inequality": inequality_dict,
-        "ineq_template": inequality_template,
-        "answer": answer 
-    })
+#prompt text only depends on n, build it once per batch size
+@functools.lru_cache(maxsize=None)
+def BATCH_PROMPT_EASY(n: int) -> bytes:
+    return str(n).encode("ascii").join(_EASY_PARTS)
 
 
-prompt = (BATCH_PROMPT_EASY(len(batch_items)) if difficulty == "easy"
-          else BATCH_PROMPT_DIFFICULT(len(batch_items)))
-
-
-batched_prompt = prompt + "\n\nJSON INPUT:\n" + json.dumps({"items": batch_items}, ensure_ascii=False)
-
-explanations = {}  
-try:
-    res = subprocess.run(
-        ["claude", "-p", "--output-format", "text", batched_prompt],
-        capture_output=True, text=True
-    )
-    if res.returncode == 0:
-        resp = res.stdout.strip()
-        try:
-            arr = json.loads(resp)
-            if isinstance(arr, list):
-                for obj in arr:
-                    if isinstance(obj, dict) and "index" in obj:
-                        explanations[obj["index"]] = {
-                            "explanation": (obj.get("explanation") or "").strip(),
-                            "reasoned_answer": (obj.get("reasoned_answer") or "").strip()
-                        }
-        except Exception:
-            
-            pass
-    else:
-       
-        pass
-except Exception:
-    
-    pass
+@functools.lru_cache(maxsize=None)
+def BATCH_PROMPT_DIFFICULT(n: int) -> bytes:
+    return str(n).encode("ascii").join(_DIFFICULT_PARTS)
 
-# Build final items with merged explanations (fallback to empty strings if missing)
+
+
+# -------------------- BATCH CALL --------------------
+
+
+#one pass builds the LLM payload and the final item shells; both share the same
+#equality dict (the payload gets a compact inequality), explanations are filled in after the call
+#(or right here when TS_LOCAL_EXPLAIN=1, in which case no payload is needed)
+batch_items = []
 items = []
-for i, (equality_dict, inequality_template, inequality_dict, answer) in enumerate(puzzles, start=1):
-    info = explanations.get(i, {"explanation": "", "reasoned_answer": ""})
+for i, puzzle in enumerate(puzzles, start=1):
+    fields = to_dict(puzzle)
+    explanation, reasoned_answer = "", ""
+    if LOCAL_EXPLAIN:
+        explanation, reasoned_answer = local_explain(puzzle)
+    else:
+        batch_items.append({
+            "index": i,
+            **fields,
+            "inequality": compact_inequality(fields["inequality"])
+        })
     items.append({
         "id": f"{difficulty}-{i:03d}",
         "difficulty": difficulty,
-        "equality": equality_dict,
-        "inequality": inequality_dict,
-        "ineq_template": inequality_template,
-        "answer": answer,                   
-        "explanation": info["explanation"], 
-        "reasoned_answer": info["reasoned_answer"]
+        **fields,
+        "explanation": explanation, 
+        "reasoned_answer": reasoned_answer
     })
 
+
+#split the batch so chunks can be sent to the CLI in parallel; one failed chunk
+#only loses its own explanations
+CHUNK = 25
+MAX_WORKERS = 4
+
+def run_chunk(chunk):
+    prompt = (BATCH_PROMPT_EASY(len(chunk)) if difficulty == "easy"
+              else BATCH_PROMPT_DIFFICULT(len(chunk)))
+
+    batched_prompt = prompt + b"\n\nJSON INPUT:\n" + json.dumps({"items": chunk}, separators=(",", ":")).encode("utf-8")
+
+    #only accept indexes this chunk sent, so a reply renumbered from 1 can't
+    #overwrite another chunk's items in the merge
+    valid = {it["index"] for it in chunk}
+    explanations = {}
+    try:
+        res = subprocess.run(
+            ["claude", "-p", "--output-format", "text"],
+            input=batched_prompt, capture_output=True
+        )
+        if res.returncode == 0:
+            try:
+                #bytes straight in, json.loads decodes and skips surrounding whitespace
+                arr = json.loads(res.stdout)
+                if isinstance(arr, list):
+                    for obj in arr:
+                        if isinstance(obj, dict) and obj.get("index") in valid:
+                            explanations[obj["index"]] = {
+                                "explanation": (obj.get("explanation") or "").strip(),
+                                "reasoned_answer": (obj.get("reasoned_answer") or "").strip()
+                            }
+            except Exception:
+
+                pass
+        else:
+
+            pass
+    except Exception:
+
+        pass
+    return explanations
+
+
+if not LOCAL_EXPLAIN:
+    chunks = [batch_items[i:i+CHUNK] for i in range(0, len(batch_items), CHUNK)]
+
+    #indexes are global across chunks, so results merge straight into one dict
+    explanations = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        for chunk_explanations in ex.map(run_chunk, chunks):
+            explanations.update(chunk_explanations)
+
+    # Merge explanations into the final items (missing ones keep empty strings)
+    for idx, info in explanations.items():
+        if isinstance(idx, int) and 1 <= idx <= len(items):
+            items[idx - 1].update(info)
+
 # -------------------- OUTPUT --------------------
-with tempfile.NamedTemporaryFile("w", encoding="utf-8", delete=False, dir=str(path.parent)) as tf:
-    tmp = tf.name
-    json.dump(items, tf, ensure_ascii=False, indent=2)
-    tf.write("\n")
-shutil.move(tmp, path)
+#serialize once, write the whole buffer next to the target, then swap in atomically
+buf = (json.dumps(items, indent=2) + "\n").encode("utf-8")
+tmp = str(path) + ".tmp"
+with open(tmp, "wb") as f:
+    f.write(buf)
+os.replace(tmp, path)
 print(f"Wrote {path.resolve()}")
\ No newline at end of file
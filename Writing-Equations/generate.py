@@ -6,7 +6,7 @@ This script generates a batch of **linear price problems** of the form p = m * x
 where p is total price ($), x is **weight (kg)** or **volume (L)** or **items (pcs)**,
 and m is the **unit price** ($ per unit).
 
-It uses the Claude CLI in a single **batched** call to produce:
+It uses the Claude CLI in **batched** calls (CHUNK items each, run in parallel) to produce:
 - prompt text, table (rate/amount/total), graph (axes + two line points),
 - equation template (two orientations), draggable tokens (incl. distractors),
 - answers (both valid orientations), and a concise explanation.
@@ -28,10 +28,11 @@ VALIDATION
 import sys
 import json
 import pathlib
-import shutil
-import tempfile
 import subprocess
 import os
+import functools
+import concurrent.futures
+import argparse
 
 # -------------------- CLI --------------------
 
@@ -39,28 +40,46 @@ def die(msg: str, code: int = 2):
     print(msg, file=sys.stderr)
     sys.exit(code)
 
-if len(sys.argv) != 2 and len(sys.argv) != 3:
-    die("Usage: python generate.py <count> <out_path>")
+parser = argparse.ArgumentParser(description="Generate linear price puzzles (p = m * x) with the Claude CLI.")
+parser.add_argument("count", type=int, help="number of items (1..500)")
+parser.add_argument("out_path", type=pathlib.Path, nargs="?", default=pathlib.Path("data/linear_price.json"))
+args = parser.parse_args()
 
-count_raw = sys.argv[1]
-try:
-    COUNT = int(count_raw)
-    assert 1 <= COUNT <= 500
-except Exception:
-    die("count must be an integer between 1 and 500")
+if not 1 <= args.count <= 500:
+    parser.error("count must be an integer between 1 and 500")
 
-if len(sys.argv) == 3:
-    OUT_PATH = pathlib.Path(sys.argv[2])
-else:
-    OUT_PATH = pathlib.Path("data/linear_price.json")
+COUNT = args.count
+OUT_PATH = args.out_path
 
-OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+os.makedirs(OUT_PATH.parent, exist_ok=True)
 CLAUDE_CLI = os.environ.get("CLAUDE_CLI", "claude")
 
+# Items per LLM call, and how many calls run in parallel
+CHUNK = 25
+MAX_WORKERS = 4
+
+SLOPES = range(1, 21)
+# Fewest slope_m values a chunk is held to, so each call still varies the unit price
+MIN_SLOPES = 5
+
+
+def chunk_slopes(n_chunks: int) -> list:
+    """
+    Deal slope_m values across chunks so chunks rarely produce the same de-dup key
+    (item_name, x_unit, slope_m). At most len(SLOPES) // MIN_SLOPES disjoint slices are
+    made; with more chunks than that, slices are reused and validate.py drops any overlap.
+    Returns one tuple of slopes per chunk; a single chunk is unconstrained.
+    """
+    groups = min(n_chunks, len(SLOPES) // MIN_SLOPES)
+    if groups <= 1:
+        return [()] * n_chunks
+    return [tuple(SLOPES[c % groups::groups]) for c in range(n_chunks)]
+
 
 # -------------------- Batch Prompt --------------------
 
-def build_batch_prompt(n: int) -> str:
+@functools.lru_cache(maxsize=None)
+def build_batch_prompt(n: int, slopes: tuple = ()) -> str:
     """
     Batched prompt for Claude (price problems with variety):
       - Always p = m * x with p in dollars ($).
@@ -71,7 +90,10 @@ def build_batch_prompt(n: int) -> str:
       - Two templates allowed: "_ = _ * _" OR "_ * _ = _" (flipped).
       - 3..5 tokens: must include p, chosen x_var, and const m; optional distractor consts.
       - Graph uses integer ticks: 5 x-ticks and corresponding y-ticks = m * x.
+      - slopes (from chunk_slopes) restricts this call to its own slope_m slice.
     """
+    restrict = (f"- This batch may ONLY use slope_m values from {{{', '.join(map(str, slopes))}}} (any mode); vary among them.\n"
+                if slopes else "")
     return f"""
 You are generating Brilliant-style **price** linear problems (p = m * x). Output **JSON ONLY**.
 
@@ -182,7 +204,7 @@ STYLE & VARIETY
 - Vary item_name among foods/goods measurable in kg/L/pcs.
 - Vary which mode (per_kg / per_L / per_item), slope_m, amount, and tick steps.
 - Keep axes clean (exactly 5 ticks each); integers only; concise voice.
-
+{restrict}
 EXAMPLES (do not copy numbers verbatim)
 [
   {{
@@ -259,42 +281,72 @@ GENERATE NOW
 
 # -------------------- LLM Call --------------------
 
-def call_claude(prompt: str) -> str:
+class ChunkError(Exception):
+    """Raised from worker threads; main() cancels the queued chunks and exits with .code."""
+    def __init__(self, msg: str, code: int):
+        super().__init__(msg)
+        self.code = code
+
+
+def call_claude(prompt: str) -> bytes:
+    # Raw bytes: json.loads decodes UTF-8 itself, no text layer / strip copy needed
     try:
         res = subprocess.run(
-            [CLAUDE_CLI, "-p", "--output-format", "text", prompt],
-            capture_output=True, text=True
+            [CLAUDE_CLI, "-p", "--output-format", "text"],
+            input=prompt.encode("utf-8"), capture_output=True
         )
     except FileNotFoundError:
-        die("Claude CLI not found. Install it or set CLAUDE_CLI=/path/to/claude", 127)
+        raise ChunkError("Claude CLI not found. Install it or set CLAUDE_CLI=/path/to/claude", 127)
 
     if res.returncode != 0:
-        die(f"Claude CLI failed:\n{res.stderr}\n{res.stdout}", res.returncode)
-    return res.stdout.strip()
+        raise ChunkError(f"Claude CLI failed:\n{res.stderr.decode('utf-8', 'replace')}\n{res.stdout.decode('utf-8', 'replace')}", res.returncode)
+    return res.stdout
 
 
 # -------------------- MAIN --------------------
 
-def main():
-    prompt = build_batch_prompt(COUNT)
-    raw = call_claude(prompt)
-
+def parse_items(raw: bytes) -> list:
     # Extract the largest JSON array substring if extra text slips in
     try:
-        start = raw.find("[")
-        end = raw.rfind("]")
+        start = raw.find(b"[")
+        end = raw.rfind(b"]")
         assert start != -1 and end != -1 and end > start
-        payload = raw[start:end+1]
-        items = json.loads(payload)
+        return json.loads(raw[start:end+1])
     except Exception as e:
-        die(f"Failed to parse JSON array from LLM output: {e}\n--- RAW BEGIN ---\n{raw[:1200]}\n--- RAW END ---", 5)
-
-    # (No validation here) — write as-is
-    with tempfile.NamedTemporaryFile("w", encoding="utf-8", delete=False, dir=str(OUT_PATH.parent)) as tf:
-        tmp = tf.name
-        json.dump(items, tf, ensure_ascii=False, indent=2)
-        tf.write("\n")
-    shutil.move(tmp, OUT_PATH)
+        raise ChunkError(f"Failed to parse JSON array from LLM output: {e}\n--- RAW BEGIN ---\n{raw[:1200].decode('utf-8', 'replace')}\n--- RAW END ---", 5)
+
+
+def run_chunk(n: int, slopes: tuple) -> list:
+    return parse_items(call_claude(build_batch_prompt(n, slopes)))
+
+
+def main():
+    sizes = [min(CHUNK, COUNT - i) for i in range(0, COUNT, CHUNK)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = [ex.submit(run_chunk, n, slopes) for n, slopes in zip(sizes, chunk_slopes(len(sizes)))]
+        # Stop at the first failing chunk: drop the queued ones instead of running them for nothing
+        try:
+            for fut in concurrent.futures.as_completed(futures):
+                fut.result()
+        except ChunkError as e:
+            ex.shutdown(cancel_futures=True)
+            die(str(e), e.code)
+    items = [it for fut in futures for it in fut.result()]
+
+    # Each chunk numbers its own ids, so renumber to keep them unique across chunks;
+    # a single call's ids are kept as the model returned them
+    if len(sizes) > 1:
+        for i, it in enumerate(items, start=1):
+            if isinstance(it, dict):
+                it["id"] = f"lin-{i:03d}"
+
+    # (No validation here) — written as returned, apart from the id renumbering above
+    # Serialize once, write the buffer next to the target, then swap in atomically
+    buf = (json.dumps(items, ensure_ascii=False, indent=2) + "\n").encode("utf-8")
+    tmp = str(OUT_PATH) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf)
+    os.replace(tmp, OUT_PATH)
     print(f"Wrote {OUT_PATH.resolve()} (items: {len(items)})")
 
 if __name__ == "__main__":
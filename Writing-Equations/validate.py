@@ -24,20 +24,33 @@ import sys
 import json
 import re
 import pathlib
-import tempfile
-import shutil
-from typing import Dict, Any, List, Tuple, Set
+import os
+import itertools
+import concurrent.futures
+from typing import Dict, Any, List, NoReturn, Optional, Tuple
 
-def die(msg: str, code: int = 2):
+def die(msg: str, code: int = 2) -> NoReturn:
     print(msg, file=sys.stderr); sys.exit(code)
 
-def require(cond: bool, errors: List[str], msg: str):
-    if not cond: errors.append(msg)
-    return cond
+def is_int(x: Any) -> bool:         return isinstance(x, int) and not isinstance(x, bool)
+def is_pos_int(x: Any) -> bool:     return is_int(x) and x > 0
+def norm(s: Optional[str]) -> str: return (s or "").strip()
 
-def is_int(x) -> bool:       return isinstance(x, int) and not isinstance(x, bool)
-def is_pos_int(x) -> bool:   return is_int(x) and x > 0
-def norm(s: str) -> str:     return (s or "").strip()
+def inc_pos(seq: List[Any]) -> bool:
+    prev = 0
+    for v in seq:
+        if not (is_pos_int(v) and v > prev): return False
+        prev = v
+    return True
+
+def pt_ok(p: Any, slope_m: Any) -> bool:
+    # exact type test: excludes bool without is_int's second isinstance
+    return (isinstance(p,list) and len(p)==2 and type(p[0]) is int and type(p[1]) is int
+            and p[1] == slope_m*p[0])
+
+# validate in worker processes from this many items on (after de-dup)
+PARALLEL_MIN_ITEMS = 2000
+PARALLEL_CHUNKSIZE = 256
 
 REQ_ROOT_KEYS = ["id","stem","table","graph","equation_template","tokens","answers","explanation"]
 
@@ -49,16 +62,44 @@ MODES = {
     "n": ("items",  "pcs","pc"),
 }
 
+# Mode-derived strings the checks compare against, built once:
+# x_var: (x_axis label lowercased, unit_price display suffix, amount display suffix)
+MODE_EXPECTED = {
+    xv: (f"{name} ({unit})".lower(), f"/{lab}", f" {unit}")
+    for xv, (name, unit, lab) in MODES.items()
+}
+
+# Every valid (y_var, y_name, y_unit, x_var, x_name, x_unit, x_unit_label) combination,
+# built once: a valid context passes with a single set lookup
+VALID_CONTEXTS = frozenset(("p", "price", "$", xv, name, unit, lab) for xv, (name, unit, lab) in MODES.items())
+
+def quick_reject(item: Dict[str, Any]) -> List[str]:
+    """Cheap structural gate run before validate_item: missing root keys, non-price y_var
+    or unknown x_var. Returns the rejection reasons (empty list = run the full check)."""
+    missing = [f"missing key: {k}" for k in REQ_ROOT_KEYS if k not in item]
+    if missing: return missing
+    ctx = item["stem"].get("context", {})
+    reasons = []
+    if norm(ctx.get("y_var","")) != "p":
+        reasons.append("y_var must be 'p'")
+    if norm(ctx.get("x_var","")) not in MODES:
+        reasons.append(f"x_var must be one of {list(MODES.keys())}")
+    return reasons
+
 def validate_item(item: Dict[str, Any]) -> Tuple[bool, List[str]]:
     errs: List[str] = []
+    errs_append = errs.append
 
     # 1) Root keys
     for k in REQ_ROOT_KEYS:
-        require(k in item, errs, f"missing key: {k}")
+        if k not in item:
+            errs_append(f"missing key: {k}")
     if errs: return False, errs
 
     # 2) Context (price-only + one mode)
-    stem = item["stem"]
+    # Root keys are known present: bind the sections once
+    stem, table, graph = item["stem"], item["table"], item["graph"]
+    answers, expl = item["answers"], item["explanation"]
     ctx = stem.get("context", {})
     y_var   = norm(ctx.get("y_var",""))
     y_name  = norm(ctx.get("y_name",""))
@@ -69,151 +110,204 @@ def validate_item(item: Dict[str, Any]) -> Tuple[bool, List[str]]:
     x_ulab  = norm(ctx.get("x_unit_label",""))
     item_nm = norm(ctx.get("item_name",""))
     slope_m = ctx.get("slope_m", None)
+    y_name_lc, x_name_lc = y_name.lower(), x_name.lower()
+
+    # Per-field checks only run (to collect messages) when the context isn't a known mode
+    ctx_ok = (y_var, y_name_lc, y_unit, x_var, x_name_lc, x_unit, x_ulab) in VALID_CONTEXTS
+    if not ctx_ok:
+        if y_var != "p":
+            errs_append("y_var must be 'p'")
+        if y_name_lc != "price":
+            errs_append("y_name must be 'price'")
+        if y_unit != "$":
+            errs_append("y_unit must be '$'")
+        if x_var not in MODES:
+            errs_append(f"x_var must be one of {list(MODES.keys())}")
+        else:
+            exp_name, exp_unit, exp_lab = MODES[x_var]
+            if x_name_lc != exp_name:
+                errs_append(f"x_name must be '{exp_name}'")
+            if x_unit != exp_unit:
+                errs_append(f"x_unit must be '{exp_unit}'")
+            if x_ulab != exp_lab:
+                errs_append(f"x_unit_label must be '{exp_lab}'")
+
+    # A valid context matches its mode exactly, so the precomputed strings apply;
+    # otherwise build them from the item's own values
+    if ctx_ok:
+        x_label_lc, up_sfx, amt_sfx = MODE_EXPECTED[x_var]
+    else:
+        x_label_lc, up_sfx, amt_sfx = f"{x_name} ({x_unit})".lower(), f"/{x_ulab}", f" {x_unit}"
+    sm_str = str(slope_m)
 
-    require(y_var == "p", errs, "y_var must be 'p'")
-    require(y_name.lower() == "price", errs, "y_name must be 'price'")
-    require(y_unit == "$", errs, "y_unit must be '$'")
-    require(x_var in MODES, errs, f"x_var must be one of {list(MODES.keys())}")
-    if x_var in MODES:
-        exp_name, exp_unit, exp_lab = MODES[x_var]
-        require(x_name.lower() == exp_name, errs, f"x_name must be '{exp_name}'")
-        require(x_unit == exp_unit,         errs, f"x_unit must be '{exp_unit}'")
-        require(x_ulab == exp_lab,          errs, f"x_unit_label must be '{exp_lab}'")
-
-    require(item_nm != "", errs, "item_name empty")
-    require(is_int(slope_m) and 1 <= slope_m <= 20, errs, "slope_m must be int in [1..20]")
+    if item_nm == "":
+        errs_append("item_name empty")
+    if not (is_int(slope_m) and 1 <= slope_m <= 20):
+        errs_append("slope_m must be int in [1..20]")
 
     prompt_text = norm(stem.get("prompt_text",""))
-    require(("p" in prompt_text or "price" in prompt_text.lower()), errs, "prompt must reference price/p")
-    require((x_var in prompt_text or x_name in prompt_text.lower()), errs, "prompt must reference x_var/x_name")
-    require("$" in prompt_text, errs, "prompt should mention currency '$'")
-    require(item_nm.lower() in prompt_text.lower(), errs, "prompt should mention item_name")
+    prompt_lc = prompt_text.lower()
+    if not ("p" in prompt_text or "price" in prompt_lc):
+        errs_append("prompt must reference price/p")
+    if not (x_var in prompt_text or x_name in prompt_lc):
+        errs_append("prompt must reference x_var/x_name")
+    if "$" not in prompt_text:
+        errs_append("prompt should mention currency '$'")
+    if item_nm.lower() not in prompt_lc:
+        errs_append("prompt should mention item_name")
 
     # 3) Table
-    table = item["table"]
-    up_val = table.get("unit_price",{}).get("value",None)
-    up_disp= norm(table.get("unit_price",{}).get("display",""))
-    amt_val= table.get("amount",{}).get("value",None)
-    amt_disp=norm(table.get("amount",{}).get("display",""))
-    tot_val= table.get("total",{}).get("value",None)
-    tot_disp=norm(table.get("total",{}).get("display",""))
-
-    require(is_pos_int(up_val) and up_val == slope_m, errs, "unit_price.value must equal slope_m")
-    require(up_disp.startswith("$") and (f"/{x_ulab}" in up_disp) and str(slope_m) in up_disp,
-            errs, "unit_price.display must include '$', slope_m, and '/{x_unit_label}'")
-    require(is_pos_int(amt_val) and 1 <= amt_val <= 10, errs, "amount.value must be 1..10")
-    require(amt_disp.endswith(f" {x_unit}") and str(amt_val) in amt_disp,
-            errs, "amount.display must be '<amount> {x_unit}'")
-    require(is_pos_int(tot_val) and tot_val == slope_m * amt_val, errs,
-            "total.value must equal slope_m * amount.value")
-    require(tot_disp.startswith("$") and str(tot_val) in tot_disp,
-            errs, "total.display must start with '$' and include total value")
+    up: Dict[str, Any] = table.get("unit_price") or {}
+    amt: Dict[str, Any] = table.get("amount") or {}
+    tot: Dict[str, Any] = table.get("total") or {}
+    up_val: Any = up.get("value",None)
+    up_disp= norm(up.get("display",""))
+    amt_val: Any = amt.get("value",None)
+    amt_disp=norm(amt.get("display",""))
+    tot_val: Any = tot.get("value",None)
+    tot_disp=norm(tot.get("display",""))
+
+    if not (is_pos_int(up_val) and up_val == slope_m):
+        errs_append("unit_price.value must equal slope_m")
+    if not (up_disp.startswith("$") and (up_sfx in up_disp) and sm_str in up_disp):
+        errs_append("unit_price.display must include '$', slope_m, and '/{x_unit_label}'")
+    if not (is_pos_int(amt_val) and 1 <= amt_val <= 10):
+        errs_append("amount.value must be 1..10")
+    if not (amt_disp.endswith(amt_sfx) and str(amt_val) in amt_disp):
+        errs_append("amount.display must be '<amount> {x_unit}'")
+    if not (is_pos_int(tot_val) and tot_val == slope_m * amt_val):
+        errs_append("total.value must equal slope_m * amount.value")
+    if not (tot_disp.startswith("$") and str(tot_val) in tot_disp):
+        errs_append("total.display must start with '$' and include total value")
 
     # 4) Graph
-    graph = item["graph"]
-    xaxis = graph.get("x_axis",{})
-    yaxis = graph.get("y_axis",{})
+    xaxis: Dict[str, Any] = graph.get("x_axis") or {}
+    yaxis: Dict[str, Any] = graph.get("y_axis") or {}
     x_ticks = xaxis.get("ticks",[])
     y_ticks = yaxis.get("ticks",[])
-    require(norm(xaxis.get("label","")).lower() == f"{x_name} ({x_unit})".lower(),
-            errs, "x_axis.label must match '{x_name} ({x_unit})'")
-    require(norm(yaxis.get("label","")).lower() == "price ($)", errs,
-            "y_axis.label must be 'price ($)'")
-    require(isinstance(x_ticks,list) and len(x_ticks)==5, errs, "x_ticks must be length 5")
-    require(isinstance(y_ticks,list) and len(y_ticks)==5, errs, "y_ticks must be length 5")
-    if len(x_ticks)==5 and len(y_ticks)==5:
-        def inc_pos(seq): 
-            return all(is_pos_int(seq[i]) and (i==0 or seq[i]>seq[i-1]) for i in range(len(seq)))
-        require(inc_pos(x_ticks), errs, "x_ticks must be positive increasing integers")
-        require(inc_pos(y_ticks), errs, "y_ticks must be positive increasing integers")
-        for xi, yi in zip(x_ticks, y_ticks):
-            require(yi == slope_m * xi, errs, "y_ticks must equal slope_m * x_ticks")
+    if norm(xaxis.get("label","")).lower() != x_label_lc:
+        errs_append("x_axis.label must match '{x_name} ({x_unit})'")
+    if norm(yaxis.get("label","")).lower() != "price ($)":
+        errs_append("y_axis.label must be 'price ($)'")
+    xt_ok = isinstance(x_ticks,list) and len(x_ticks)==5
+    yt_ok = isinstance(y_ticks,list) and len(y_ticks)==5
+    if not xt_ok:
+        errs_append("x_ticks must be length 5")
+    if not yt_ok:
+        errs_append("y_ticks must be length 5")
+    if xt_ok and yt_ok:
+        if not inc_pos(x_ticks):
+            errs_append("x_ticks must be positive increasing integers")
+        if not inc_pos(y_ticks):
+            errs_append("y_ticks must be positive increasing integers")
+        # One list compare on the happy path; per-tick loop only to report mismatches
+        if y_ticks != [slope_m * xi for xi in x_ticks]:
+            for xi, yi in zip(x_ticks, y_ticks):
+                if yi != slope_m * xi:
+                    errs_append("y_ticks must equal slope_m * x_ticks")
     # line points on p = m*x
     line_pts = graph.get("line_points",[])
-    require(isinstance(line_pts,list) and len(line_pts)==2, errs, "line_points must have exactly 2 points")
-    if len(line_pts)==2:
+    if not (isinstance(line_pts,list) and len(line_pts)==2):
+        errs_append("line_points must have exactly 2 points")
+    else:
         p1, p2 = line_pts
-        def pt_ok(p): return isinstance(p,list) and len(p)==2 and all(is_int(v) for v in p) and p[1]==slope_m*p[0]
-        require(pt_ok(p1) and pt_ok(p2) and p1!=p2, errs, "line_points must lie on p=m*x and be distinct")
+        if not (pt_ok(p1, slope_m) and pt_ok(p2, slope_m) and p1!=p2):
+            errs_append("line_points must lie on p=m*x and be distinct")
 
     # 5) Equation template & tokens
     eq_tmpl = norm(item.get("equation_template",""))
-    require(eq_tmpl in ("_ = _ * _","_ * _ = _"), errs, "equation_template must be '_ = _ * _' or '_ * _ = _'")
+    if eq_tmpl not in ("_ = _ * _","_ * _ = _"):
+        errs_append("equation_template must be '_ = _ * _' or '_ * _ = _'")
 
     tokens = item.get("tokens",[])
-    require(isinstance(tokens,list) and 3 <= len(tokens) <= 5, errs, "tokens must have 3..5 entries")
-    if isinstance(tokens,list):
-        has_p = any(t.get("type")=="var"  and t.get("label")=="p" for t in tokens)
-        has_x = any(t.get("type")=="var"  and t.get("label")==x_var for t in tokens)
-        has_m = any(t.get("type")=="const" and t.get("label")==str(slope_m) and t.get("value")==slope_m for t in tokens)
-        require(has_p and has_x and has_m, errs, "tokens must include var 'p', var x_var, and const slope_m")
-        seen_labels = set()
+    tok_list = isinstance(tokens,list)
+    if not (tok_list and 3 <= len(tokens) <= 5):
+        errs_append("tokens must have 3..5 entries")
+    token_labels = set()
+    if tok_list:
+        # One pass: required-token flags, duplicate labels, distractor range, label set for answers
+        has_p = has_x = has_m = False
+        seen_labels, tok_errs = set(), []
         for t in tokens:
+            ttype, raw_lbl = t.get("type"), t.get("label")
+            token_labels.add(raw_lbl)
+            if ttype == "var":
+                has_p |= raw_lbl == "p"
+                has_x |= raw_lbl == x_var
             lbl = t.get("label","")
-            require(lbl not in seen_labels, errs, "duplicate token label not allowed")
+            if lbl in seen_labels:
+                tok_errs.append("duplicate token label not allowed")
             seen_labels.add(lbl)
-            if t.get("type")=="const" and t.get("label")!=str(slope_m):
-                v = t.get("value",None)
-                require(is_int(v) and 1<=v<=20 and v!=slope_m, errs,
-                        "distractor const must be 1..20 and != slope_m")
+            if ttype=="const":
+                if raw_lbl == sm_str:
+                    has_m |= t.get("value") == slope_m
+                else:
+                    v = t.get("value",None)
+                    if not (is_int(v) and 1<=v<=20 and v!=slope_m):
+                        tok_errs.append("distractor const must be 1..20 and != slope_m")
+        if not (has_p and has_x and has_m):
+            errs_append("tokens must include var 'p', var x_var, and const slope_m")
+        errs.extend(tok_errs)
 
     # 6) Answers orientation & canonical
-    answers = item.get("answers",{})
     fills = answers.get("valid_fills",[])
     canon = norm(answers.get("canonical_str",""))
 
-    require(isinstance(fills,list) and len(fills)>=2, errs, "answers.valid_fills must include both orientations")
-    token_labels = {t.get("label") for t in tokens}
+    if not (isinstance(fills,list) and len(fills)>=2):
+        errs_append("answers.valid_fills must include both orientations")
     for f in fills:
-        require(isinstance(f,list) and len(f)==3, errs, "each valid_fills entry must have 3 symbols")
+        if not (isinstance(f,list) and len(f)==3):
+            errs_append("each valid_fills entry must have 3 symbols")
         for sym in f:
-            require(sym in token_labels, errs, f"valid_fills symbol '{sym}' not in tokens")
+            if sym not in token_labels:
+                errs_append(f"valid_fills symbol '{sym}' not in tokens")
 
     if eq_tmpl == "_ = _ * _":
-        expect_main = [["p", str(slope_m), x_var], ["p", x_var, str(slope_m)]]
+        expect_main = [["p", sm_str, x_var], ["p", x_var, sm_str]]
     else:
-        expect_main = [[str(slope_m), x_var, "p"], [x_var, str(slope_m), "p"]]
+        expect_main = [[sm_str, x_var, "p"], [x_var, sm_str, "p"]]
+    fills_set = {tuple(f) for f in fills if isinstance(f, list)}
     for ex in expect_main:
-        require(ex in fills, errs, f"valid_fills must include {ex}")
+        if tuple(ex) not in fills_set:
+            errs_append(f"valid_fills must include {ex}")
 
     expect_canon_a = f"p={slope_m}*{x_var}"
     expect_canon_b = f"{slope_m}*{x_var}=p"
-    require(canon in (expect_canon_a, expect_canon_b), errs,
-            "answers.canonical_str must be 'p=m*x' or 'm*x=p'")
+    if canon not in (expect_canon_a, expect_canon_b):
+        errs_append("answers.canonical_str must be 'p=m*x' or 'm*x=p'")
 
     # 7) Explanation
-    expl = item.get("explanation",{})
     eq_str = norm(expl.get("equation_str",""))
     e_txt  = norm(expl.get("text",""))
-    require(eq_str == f"p={slope_m}×{x_var}", errs, "explanation.equation_str must be 'p=m×x_var'")
-    require("p" in e_txt and x_var in e_txt, errs, "explanation.text must mention 'p' and x_var")
-    rate_ok = "$" in e_txt or str(slope_m) in e_txt or ("per " + ctx.get("x_unit_label","")) in e_txt
-    require(rate_ok, errs, "explanation.text should indicate price rate ($ or number)")
+    if eq_str != f"p={slope_m}×{x_var}":
+        errs_append("explanation.equation_str must be 'p=m×x_var'")
+    if not ("p" in e_txt and x_var in e_txt):
+        errs_append("explanation.text must mention 'p' and x_var")
+    rate_ok = "$" in e_txt or sm_str in e_txt or ("per " + x_ulab) in e_txt
+    if not rate_ok:
+        errs_append("explanation.text should indicate price rate ($ or number)")
 
     return len(errs)==0, errs
 
 # ---------- de-dup ----------
 
 def dedupe_items(items: List[Dict[str,Any]]) -> Tuple[List[Dict[str,Any]], int]:
-    seen: Set[Tuple[str,str,int]] = set()
-    kept: List[Dict[str,Any]] = []
-    dropped = 0
+    # dict keeps insertion order: first item per key wins, input order is preserved;
+    # items without a usable key are kept under their own id().
+    # Keys stay exact: a Bloom prefilter would still need this table to confirm hits.
+    kept: Dict[Any, Dict[str,Any]] = {}
     for it in items:
         try:
             c = it["stem"]["context"]
             key = (c["item_name"].lower().strip(), c["x_unit"], int(c["slope_m"]))
         except Exception:
-            kept.append(it); continue
-        if key in seen:
-            dropped += 1
-            continue
-        seen.add(key)
-        kept.append(it)
-    return kept, dropped
+            kept[id(it)] = it; continue
+        kept.setdefault(key, it)
+    return list(kept.values()), len(items) - len(kept)
 
 # ---------- main ----------
 
-def main():
+def main() -> None:
     if len(sys.argv) < 2:
         die("Usage: python validate.py <input.json> [--out <out.json>]")
 
@@ -225,45 +319,62 @@ def main():
         out_path = in_path.with_suffix(".passed.json")
 
     try:
-        items = json.loads(in_path.read_text(encoding="utf-8"))
+        # bytes straight into the parser (no separate text decode pass)
+        items = json.loads(in_path.read_bytes())
         assert isinstance(items, list)
     except Exception as e:
         die(f"Failed to read/parse JSON array from {in_path}: {e}", 3)
 
     items, dropped_dupes = dedupe_items(items)
 
+    # Cheap structural gate first; only items that pass it get the full check
+    quick = [quick_reject(it) for it in items]
+    to_check = [it for it, q in zip(items, quick) if not q]
+
+    # Items are independent: fan out to worker processes for big inputs,
+    # stay serial when process startup would cost more than it saves
+    workers = os.cpu_count() or 1
+    if len(to_check) >= PARALLEL_MIN_ITEMS and workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as ex:
+            # consume inside the with block so every result is in hand before the pool shuts down
+            results = iter(list(ex.map(validate_item, to_check, chunksize=PARALLEL_CHUNKSIZE)))
+    else:
+        results = map(validate_item, to_check)
+
     passed, failed = [], []
-    for it in items:
-        ok, reasons = validate_item(it)
+    for it, q in zip(items, quick):
+        ok, reasons = (False, q) if q else next(results)
         if ok: passed.append(it)
         else:  failed.append((str(it.get("id","<no-id>")), reasons))
 
-    # Write passed-only
-    with tempfile.NamedTemporaryFile("w", encoding="utf-8", delete=False, dir=str(out_path.parent)) as tf:
-        tmp = tf.name
-        json.dump(passed, tf, ensure_ascii=False, indent=2)
-        tf.write("\n")
-    shutil.move(tmp, out_path)
+    # Write passed-only: serialize once, write the buffer next to the target, then swap in atomically
+    buf = (json.dumps(passed, ensure_ascii=False, indent=2) + "\n").encode("utf-8")
+    tmp = str(out_path) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf)
+    os.replace(tmp, out_path)
 
     total = len(items)
     kept  = len(passed)
     bad   = len(failed)
     pct   = (kept / total * 100.0) if total else 0.0
 
-    print("----- VALIDATION REPORT -----")
-    print(f"Input file         : {in_path}")
-    print(f"After de-dup       : {total} items (dropped {dropped_dupes} duplicates before validation)")
-    print(f"Passed             : {kept}")
-    print(f"Failed             : {bad}")
-    print(f"Pass rate          : {pct:.1f}%")
-    print(f"Output (passed)    : {out_path}")
-
+    # Build the whole report, then write it in one go
+    lines = [
+        "----- VALIDATION REPORT -----",
+        f"Input file         : {in_path}",
+        f"After de-dup       : {total} items (dropped {dropped_dupes} duplicates before validation)",
+        f"Passed             : {kept}",
+        f"Failed             : {bad}",
+        f"Pass rate          : {pct:.1f}%",
+        f"Output (passed)    : {out_path}",
+    ]
     if failed:
-        print("\n--- Failures (first 20) ---")
-        for i, (pid, reasons) in enumerate(failed[:20], 1):
-            print(f"{i:02d}. id={pid}")
-            for r in reasons:
-                print(f"    - {r}")
+        lines.append("\n--- Failures (first 20) ---")
+        for i, (pid, reasons) in enumerate(itertools.islice(failed, 20), 1):
+            lines.append(f"{i:02d}. id={pid}")
+            lines.extend(f"    - {r}" for r in reasons)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 if __name__ == "__main__":
     main()